@@ -9,8 +9,8 @@ LIST_FILES_URL = f"https://{DOMAIN}/v1alpha/namespaces/{NAMESPACE_ID}/catalogs/{
 UPLOAD_FILES_URL = f"https://{DOMAIN}/v1alpha/namespaces/{NAMESPACE_ID}/catalogs/{KB_ID}/files"
 PROCESS_FILES_URL = f"https://{DOMAIN}/v1alpha/catalogs/files/processAsync"
 TIME_FILE_PATH = 'modified_time.txt'
-UPLOADED_FILE_PATH = 'uploaded_files.json'
-FAILED_FILE_PATH = 'failure_files.json'
-UNSUPPORTED_FILE_PATH = 'unsupported_type_files.json'
+UPLOADED_FILE_PATH = 'uploaded_files.jsonl'
+FAILED_FILE_PATH = 'failure_files.jsonl'
+UNSUPPORTED_FILE_PATH = 'unsupported_type_files.jsonl'
 SAVE_LOG_FILE = False
 SCOPES = ["https://www.googleapis.com/auth/drive"]
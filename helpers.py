@@ -1,9 +1,36 @@
 import os
-import json
-import base64
+import binascii
 from datetime import datetime
+from types import MappingProxyType
+import orjson
 import requests
-from config import TOKEN, TIME_FILE_PATH
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import TOKEN, TIME_FILE_PATH, UPLOAD_FILES_URL
+
+# Streaming chunk size in bytes: 4 MiB rounded down to a multiple of 3,
+# so each base64-encoded chunk is padding-free and the chunks concatenate
+# into valid base64.
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024 - (4 * 1024 * 1024) % 3
+
+# Default headers for every Catalog API call, built once at import so no
+# per-call dict or bearer string is constructed
+_HEADERS = MappingProxyType({
+    'Content-Type': 'application/json',
+    'Authorization': f'Bearer {TOKEN}'
+})
+
+# Shared session so TCP+TLS connections are pooled and kept alive across
+# API calls instead of being re-established per request.
+_SESSION = requests.Session()
+_SESSION.headers.update(_HEADERS)
+_SESSION.mount('https://', HTTPAdapter(
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504))
+))
+
+# (connect, read) timeouts in seconds for Catalog API calls
+_TIMEOUT = (5, 60)
 
 
 def call_catalog_api(url, method, data=None, name=""):
@@ -19,13 +46,29 @@ def call_catalog_api(url, method, data=None, name=""):
     Returns:
         dict: The JSON response from the API.
     """
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': f'Bearer {TOKEN}'
-    }
-    response = requests.request(method, url, headers=headers, json=data)
+    body = orjson.dumps(data) if data is not None else None
+    response = _SESSION.request(method, url, data=body, timeout=_TIMEOUT)
     response.raise_for_status()  # Raises HTTPError for bad responses
-    return response.json()
+    return orjson.loads(response.content)
+
+
+# MIME types Catalog supports, shared by the per-file type check and the
+# server-side Drive query; read-only so callers cannot mutate it
+_MIME_TO_TYPE = MappingProxyType({
+    "application/pdf": "FILE_TYPE_PDF",
+    "text/plain": "FILE_TYPE_TEXT",
+    "text/markdown": "FILE_TYPE_MARKDOWN",
+    "image/png": "FILE_TYPE_PNG",
+    "image/jpeg": "FILE_TYPE_JPEG",
+    "image/jpg": "FILE_TYPE_JPG",
+    "text/html": "FILE_TYPE_HTML",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "FILE_TYPE_DOCX",
+    "application/msword": "FILE_TYPE_DOC",
+    "application/vnd.ms-powerpoint": "FILE_TYPE_PPT",
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation": "FILE_TYPE_PPTX",
+    "application/vnd.ms-excel": "FILE_TYPE_XLS",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "FILE_TYPE_XLSX",
+})
 
 
 def get_file_type(mime_type):
@@ -38,44 +81,142 @@ def get_file_type(mime_type):
     Returns:
         str: The corresponding file type or 'none' if unsupported.
     """
-    mime_type_to_file_type = {
-        "application/pdf": "FILE_TYPE_PDF",
-        "text/plain": "FILE_TYPE_TEXT",
-        "text/markdown": "FILE_TYPE_MARKDOWN",
-        "image/png": "FILE_TYPE_PNG",
-        "image/jpeg": "FILE_TYPE_JPEG",
-        "image/jpg": "FILE_TYPE_JPG",
-        "text/html": "FILE_TYPE_HTML",
-        "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "FILE_TYPE_DOCX",
-        "application/msword": "FILE_TYPE_DOC",
-        "application/vnd.ms-powerpoint": "FILE_TYPE_PPT",
-        "application/vnd.openxmlformats-officedocument.presentationml.presentation": "FILE_TYPE_PPTX",
-        "application/vnd.ms-excel": "FILE_TYPE_XLS",
-        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "FILE_TYPE_XLSX",
-    }
-    return mime_type_to_file_type.get(mime_type, "none")
+    return _MIME_TO_TYPE.get(mime_type, "none")
 
 
-def process_file_data(file_path, file_type):
+def build_drive_query(modified_time):
     """
-    Process file data for upload.
+    Build a files.list query that filters results server-side.
+
+    Excludes trashed items and folders and restricts results to the MIME
+    types Catalog supports, plus Google Docs Editors files (which are
+    exported as PDF), so unsupported files never come back in the list.
 
     Args:
-        file_path (str): The path to the file.
-        file_type (str): The type of the file.
+        modified_time (str): The ISO 8601 lower bound for modifiedTime.
 
     Returns:
-        dict: The file data in a format suitable for uploading.
+        str: The query string for files.list.
+    """
+    supported = " or ".join(f"mimeType = '{mime_type}'" for mime_type in _MIME_TO_TYPE)
+    return (
+        f"modifiedTime >= '{modified_time}'"
+        " and trashed = false"
+        " and mimeType != 'application/vnd.google-apps.folder'"
+        f" and ({supported} or mimeType contains 'application/vnd.google-apps.')"
+    )
+
+
+def b64_encode_chunks(chunks):
+    """
+    Lazily base64-encode an iterable of byte chunks.
+
+    Carries a remainder of up to two bytes between chunks so every
+    encoded block is padding-free until the final one, regardless of the
+    incoming chunk sizes.
+
+    Args:
+        chunks (iterable): An iterable of raw byte chunks.
+
+    Yields:
+        bytes: A base64-encoded chunk.
+    """
+    remainder = b''
+    for chunk in chunks:
+        if remainder:
+            chunk = remainder + chunk
+        cut = len(chunk) - len(chunk) % 3
+        if cut == len(chunk):
+            # Aligned chunk: encode as-is with no slicing copy
+            remainder = b''
+            if chunk:
+                yield binascii.b2a_base64(chunk, newline=False)
+        else:
+            if cut:
+                yield binascii.b2a_base64(chunk[:cut], newline=False)
+            remainder = chunk[cut:]
+    if remainder:
+        yield binascii.b2a_base64(remainder, newline=False)
+
+
+def stream_drive_file(request, access_token, chunk_size=UPLOAD_CHUNK_SIZE):
     """
-    with open(file_path, "rb") as file:
-        base64_file = base64.b64encode(file.read())
+    Stream the content of a Drive download request in chunks.
 
-    data = {
-        "name": file_path,
-        "type": file_type,
-        "content": base64_file.decode('utf-8')
-    }
-    return data
+    Args:
+        request: The Drive media request (get_media or export_media).
+        access_token (str): The OAuth access token for the Drive API.
+        chunk_size (int, optional): The chunk size in bytes.
+
+    Returns:
+        iterator: An iterator over raw byte chunks of the file content.
+    """
+    response = _SESSION.get(
+        request.uri,
+        headers={'Authorization': f'Bearer {access_token}'},
+        stream=True,
+        timeout=_TIMEOUT
+    )
+    response.raise_for_status()  # Raises HTTPError for bad responses
+    return response.iter_content(chunk_size=chunk_size)
+
+
+class _SizedBody:
+    """
+    Iterable request body with a known length.
+
+    Exposing __len__ lets requests compute the exact Content-Length for a
+    streamed body itself; a bare generator has no length, so requests
+    would frame the request with Transfer-Encoding: chunked instead.
+
+    Args:
+        chunks (iterable): An iterable of raw byte chunks of the body.
+        length (int): The total body length in bytes.
+    """
+
+    def __init__(self, chunks, length):
+        self._chunks = chunks
+        self._length = length
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+    def __len__(self):
+        return self._length
+
+
+def upload_file_streaming(file_name, file_type, chunks, file_size=None):
+    """
+    Upload a stream of file content to the Instill Catalog.
+
+    Streams the JSON request body - the metadata fields followed by the
+    base64-encoded content - so peak memory stays at one chunk regardless
+    of file size. When the content size is known in advance the exact
+    Content-Length is sent; otherwise the body uses chunked encoding.
+
+    Args:
+        file_name (str): The name to upload the file under.
+        file_type (str): The type of the file.
+        chunks (iterable): An iterable of raw byte chunks of file content.
+        file_size (int, optional): The content size in bytes, if known.
+
+    Returns:
+        dict: The JSON response from the API.
+    """
+    prologue = orjson.dumps({"name": file_name, "type": file_type})[:-1] + b',"content":"'
+    epilogue = b'"}'
+
+    def body():
+        yield prologue
+        yield from b64_encode_chunks(chunks)
+        yield epilogue
+
+    data = body()
+    if file_size is not None:
+        data = _SizedBody(data, len(prologue) + (file_size + 2) // 3 * 4 + len(epilogue))
+    response = _SESSION.post(UPLOAD_FILES_URL, data=data, timeout=_TIMEOUT)
+    response.raise_for_status()  # Raises HTTPError for bad responses
+    return orjson.loads(response.content)
 
 
 def get_current_time_formatted():
@@ -114,44 +255,33 @@ def read_modified_time_from_file():
 
 def load_uploaded_files(file_path):
     """
-    Load the list of uploaded file IDs from a local file.
+    Load the set of file IDs from a local JSON-Lines ledger.
 
     Args:
-        file_path (str): The path to the file containing the list of uploaded file IDs.
+        file_path (str): The path to the ledger file, one file ID per line.
 
     Returns:
-        list: A list of uploaded file IDs.
+        set: The set of file IDs read from the ledger.
     """
     if os.path.exists(file_path):
         with open(file_path, 'r') as file:
-            data = json.load(file)
-            return data.get("data", [])
-    return []
+            return {line.strip() for line in file if line.strip()}
+    return set()
 
 
-def save_uploaded_files(uploaded_files, file_path):
+def append_file_id(file_id, id_set, file_path):
     """
-    Save the list of uploaded file IDs to a local file.
+    Add a new file ID to an in-memory set and append it to the ledger.
 
-    Args:
-        uploaded_files (list): A list of uploaded file IDs.
-        file_path (str): The path to the file to save the list.
-    """
-    with open(file_path, 'w') as file:
-        json.dump({"data": uploaded_files}, file, indent=4)
-
-
-def append_file_id(file_id, file_path):
-    """
-    Append a new file ID to the list and save it.
+    Appending a single line avoids rewriting the whole tracking file on
+    every update.
 
     Args:
         file_id (str): The file ID to append.
-        file_path (str): The path to the file containing the list of file IDs.
+        id_set (set): The in-memory set of file IDs already recorded.
+        file_path (str): The path to the ledger file, one file ID per line.
     """
-    uploaded_files = load_uploaded_files(file_path)
-
-    if file_id not in uploaded_files:  # Avoid duplicates
-        uploaded_files.append(file_id)
-
-    save_uploaded_files(uploaded_files, file_path)
+    if file_id not in id_set:  # Avoid duplicates and redundant writes
+        id_set.add(file_id)
+        with open(file_path, 'a') as file:
+            file.write(file_id + '\n')
@@ -1,14 +1,17 @@
 import os
 import logging
-import io
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
-from config import SCOPES, UPLOAD_FILES_URL, PROCESS_FILES_URL, UPLOADED_FILE_PATH, FAILED_FILE_PATH, UNSUPPORTED_FILE_PATH, SAVE_LOG_FILE
-from helpers import call_catalog_api, get_file_type, process_file_data, get_current_time_formatted, save_modified_time_to_file, read_modified_time_from_file, append_file_id, load_uploaded_files
+from googleapiclient.errors import HttpError
+from config import SCOPES, PROCESS_FILES_URL, UPLOADED_FILE_PATH, FAILED_FILE_PATH, UNSUPPORTED_FILE_PATH, SAVE_LOG_FILE
+from helpers import call_catalog_api, get_file_type, build_drive_query, stream_drive_file, upload_file_streaming, get_current_time_formatted, save_modified_time_to_file, read_modified_time_from_file, append_file_id, load_uploaded_files
 
 # Set up logging
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -20,22 +23,45 @@ logging.basicConfig(
     handlers=handlers
 )
 
+# Number of concurrent per-file workers; the work is network-bound so
+# threads overlap download/upload latency without contention on the GIL.
+MAX_WORKERS = 8
 
-def main():
+# Number of uploaded files to accumulate before one processAsync call
+PROCESS_BATCH_SIZE = 50
+
+# Number of attempts at a full sync before giving up
+MAX_RETRIES = 3
+
+# Skip the refresh round trip while the token has this long left to live
+TOKEN_EXPIRY_MARGIN_SECONDS = 60
+
+# Serializes token refreshes so concurrent callers trigger at most one
+_refresh_lock = threading.Lock()
+
+
+def get_credentials():
     """
-    Main function to synchronize files from Google Drive to Instill Catalog.
+    Load cached OAuth credentials, refreshing only when close to expiry.
+
+    The refresh round trip is skipped while the access token still has
+    more than TOKEN_EXPIRY_MARGIN_SECONDS of validity, and refreshes are
+    serialized so concurrent callers trigger at most one.
 
-    Authenticates with Google Drive, lists modified files, processes them,
-    and uploads them to Instill Catalog. Handles errors and logging.
+    Returns:
+        Credentials: Valid Google OAuth credentials.
     """
     creds = None
 
-    # Load existing credentials or initiate the OAuth flow
     if os.path.exists("token.json"):
         creds = Credentials.from_authorized_user_file("token.json", SCOPES)
 
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
+    if (creds and creds.valid and creds.expiry
+            and (creds.expiry - datetime.utcnow()).total_seconds() > TOKEN_EXPIRY_MARGIN_SECONDS):
+        return creds
+
+    with _refresh_lock:
+        if creds and creds.refresh_token:
             creds.refresh(Request())
         else:
             flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
@@ -43,103 +69,286 @@ def main():
         with open("token.json", "w") as token:
             token.write(creds.to_json())
 
-    try:
-        service = build("drive", "v3", credentials=creds)
-        query_modified_time = read_modified_time_from_file()
+    return creds
+
 
-        if not query_modified_time:
-            query_modified_time = get_current_time_formatted()
-            save_modified_time_to_file(query_modified_time)
+def ensure_fresh_credentials(creds):
+    """
+    Refresh the credentials if the access token is no longer valid.
 
+    Long syncs can outlive the access token, so workers call this before
+    each download. Refreshes are serialized on _refresh_lock so
+    concurrent workers trigger at most one round trip.
+
+    Args:
+        creds: The Google OAuth credentials.
+    """
+    if creds.valid:
+        return
+
+    with _refresh_lock:
+        if not creds.valid:
+            creds.refresh(Request())
+            with open("token.json", "w") as token:
+                token.write(creds.to_json())
+
+
+def list_modified_files(service, query):
+    """
+    Lazily list all Drive files matching a query, following pagination.
+
+    Args:
+        service: The Google Drive API service object.
+        query (str): The files.list query string.
+
+    Yields:
+        dict: File metadata containing id, name, modifiedTime, mimeType
+            and size (absent for Google Docs Editors files).
+    """
+    page_token = None
+    while True:
         results = (
             service.files()
             .list(
-                fields="nextPageToken, files(id, name, modifiedTime)",
-                q=f"modifiedTime >= '{query_modified_time}'",
+                fields="nextPageToken, files(id, name, modifiedTime, mimeType, size)",
+                q=query,
+                pageSize=1000,
+                pageToken=page_token,
             )
             .execute()
         )
-        items = results.get("files", [])
+        yield from results.get("files", [])
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            break
+
 
-        if not items:
-            logging.info("No files found.")
+def flush_process_batch(batch, uploaded_set, failed_set, lock):
+    """
+    Submit one processAsync call for a batch of uploaded files.
+
+    Marks each file as uploaded or failed according to the per-file
+    statuses in the response.
+
+    Args:
+        batch (list): Tuples of (file_uid, file_id, file_name) to process.
+        uploaded_set (set): IDs of files already uploaded.
+        failed_set (set): IDs of files that failed to upload or process.
+        lock (threading.Lock): Guards the tracking sets and files.
+    """
+    if not batch:
+        return
+
+    try:
+        process_data = call_catalog_api(PROCESS_FILES_URL, 'POST', {"fileUids": [uid for uid, _, _ in batch]}, 'Process Files')
+    except Exception as error:
+        logging.warning(error)
+        process_data = {}
+
+    statuses = {f.get("fileUid"): f.get("processStatus") for f in process_data.get("files", [])}
+
+    for file_uid, file_id, file_name in batch:
+        if statuses.get(file_uid):
+            with lock:
+                append_file_id(file_id, uploaded_set, UPLOADED_FILE_PATH)
+        else:
+            logging.warning(f"Failed to process file '{file_name}' with ID '{file_id}'.")
+            with lock:
+                append_file_id(file_id, failed_set, FAILED_FILE_PATH)
+
+
+def submit_for_processing(entry, pending, uploaded_set, failed_set, lock):
+    """
+    Queue an uploaded file for processing, flushing a full batch.
+
+    Args:
+        entry (tuple): A (file_uid, file_id, file_name) tuple.
+        pending (list): The shared queue of entries awaiting processing.
+        uploaded_set (set): IDs of files already uploaded.
+        failed_set (set): IDs of files that failed to upload or process.
+        lock (threading.Lock): Guards the queue and tracking sets.
+    """
+    with lock:
+        pending.append(entry)
+        if len(pending) < PROCESS_BATCH_SIZE:
             return
+        batch = pending[:]
+        pending.clear()
+
+    flush_process_batch(batch, uploaded_set, failed_set, lock)
+
 
-        for item in items:
-            try:
-                logging.info(f"=== Processing file: {item['name']} ===")
-
-                file_id = item['id']
-
-                if file_id in load_uploaded_files(UPLOADED_FILE_PATH):
-                    logging.info(f"File '{item['name']}' with ID '{file_id}' has already been uploaded.")
-                    continue
-
-                file_metadata = service.files().get(fileId=file_id, fields='mimeType, name').execute()
-                mime_type = file_metadata['mimeType']
-                file_name = file_metadata['name']
-                local_file_name = f'{file_name}.pdf' if mime_type.startswith('application/vnd.google-apps.') else file_name
-
-                if mime_type == "application/vnd.google-apps.folder":
-                    logging.info(f"File '{file_name}' with ID '{file_id}' is a folder and will not be processed.")
-                    continue
-
-                if mime_type.startswith('application/vnd.google-apps.'):
-                    # Export Google Docs Editors files
-                    mime_type = 'application/pdf'  # Example export format
-                    request = service.files().export_media(fileId=file_id, mimeType=mime_type)
-                else:
-                    # Download other file types directly
-                    request = service.files().get_media(fileId=file_id)
-
-                file_type = get_file_type(mime_type)
-                if file_type == "none":
-                    logging.info(f"File name: '{file_name}' with file type '{mime_type}' is not supported in Catalog.")
-                    append_file_id(file_id, UNSUPPORTED_FILE_PATH)
-                    continue
-
-                # Create a file stream to write the downloaded content
-                with io.FileIO(local_file_name, 'wb') as fh:
-                    downloader = MediaIoBaseDownload(fh, request)
-                    done = False
-                    while not done:
-                        status, done = downloader.next_chunk()
-
-                file_data = process_file_data(local_file_name, file_type)
-
-                uploaded_file = call_catalog_api(UPLOAD_FILES_URL, 'POST', file_data, 'Upload Files')
-                file_uid = uploaded_file.get("file", {}).get("fileUid", None)
-
-                if not file_uid:
-                    logging.warning("API failure: ", uploaded_file)
-                    logging.warning(f"Failed to upload file '{file_name}' with ID '{file_id}'.")
-                    append_file_id(file_id, FAILED_FILE_PATH)
-                    os.remove(local_file_name)
-                    continue
-
-                process_data = call_catalog_api(PROCESS_FILES_URL, 'POST', {"fileUids": [file_uid]}, 'Process Files')
-                process_status = process_data.get("files", [{}])[0].get("processStatus", None)
-
-                if not process_status:
-                    logging.warning(f"Failed to process file '{file_name}' with ID '{file_id}'.")
-                    append_file_id(file_id, FAILED_FILE_PATH)
-                    os.remove(local_file_name)
-                    continue
-
-                os.remove(local_file_name)
-                append_file_id(file_id, UPLOADED_FILE_PATH)
-
-            except Exception as error:
-                logging.warning(f"Failed to download file '{file_name}' with ID '{file_id}'.")
-                logging.warning(error)
-                if os.path.exists(local_file_name):
-                    os.remove(local_file_name)
-                continue
+def process_file(item, service, creds, uploaded_set, failed_set, unsupported_set, pending, lock):
+    """
+    Download a single Drive file and upload it to Instill Catalog.
+
+    Safe to run from multiple worker threads: mutations of the shared
+    tracking sets and their backing files are guarded by the lock.
+
+    Args:
+        item (dict): The Drive file metadata from files.list.
+        service: The Google Drive API service object.
+        creds: The Google OAuth credentials.
+        uploaded_set (set): IDs of files already uploaded.
+        failed_set (set): IDs of files that failed to upload or process.
+        unsupported_set (set): IDs of files with unsupported types.
+        pending (list): The shared queue of entries awaiting processing.
+        lock (threading.Lock): Guards the queue, tracking sets and files.
+    """
+    try:
+        # Already-uploaded files cost one set lookup and nothing else
+        file_id = item['id']
+
+        if file_id in uploaded_set:
+            logging.info(f"File '{item['name']}' with ID '{file_id}' has already been uploaded.")
+            return
+
+        logging.info(f"=== Processing file: {item['name']} ===")
+
+        mime_type = item['mimeType']
+        file_name = item['name']
+        is_export = mime_type.startswith('application/vnd.google-apps.')
+        upload_name = f'{file_name}.pdf' if is_export else file_name
+
+        if mime_type == "application/vnd.google-apps.folder":
+            logging.info(f"File '{file_name}' with ID '{file_id}' is a folder and will not be processed.")
+            return
+
+        if is_export:
+            # Export Google Docs Editors files
+            mime_type = 'application/pdf'  # Example export format
+
+        # Bail out on unsupported types before any download work happens
+        file_type = get_file_type(mime_type)
+        if file_type == "none":
+            logging.info(f"File name: '{file_name}' with file type '{mime_type}' is not supported in Catalog.")
+            with lock:
+                append_file_id(file_id, unsupported_set, UNSUPPORTED_FILE_PATH)
+            return
+
+        if is_export:
+            request = service.files().export_media(fileId=file_id, mimeType=mime_type)
+            file_size = None  # export size is unknown until the response arrives
+        else:
+            # Download other file types directly
+            request = service.files().get_media(fileId=file_id)
+            file_size = int(item['size']) if 'size' in item else None
+
+        # Stream the download response straight into the upload; the raw
+        # session does not auto-refresh, so revalidate the token first
+        ensure_fresh_credentials(creds)
+        content = stream_drive_file(request, creds.token)
+        uploaded_file = upload_file_streaming(upload_name, file_type, content, file_size)
+        file_uid = uploaded_file.get("file", {}).get("fileUid", None)
+
+        if not file_uid:
+            logging.warning("API failure: ", uploaded_file)
+            logging.warning(f"Failed to upload file '{file_name}' with ID '{file_id}'.")
+            with lock:
+                append_file_id(file_id, failed_set, FAILED_FILE_PATH)
+            return
+
+        submit_for_processing((file_uid, file_id, file_name), pending, uploaded_set, failed_set, lock)
 
     except Exception as error:
+        logging.warning(f"Failed to sync file '{item['name']}' with ID '{item['id']}'.")
         logging.warning(error)
-        # Retry on failure
-        main()
+        with lock:
+            append_file_id(item['id'], failed_set, FAILED_FILE_PATH)
+
+
+def _backoff_delay(attempt, error):
+    """
+    Choose how long to sleep before retrying a failed sync attempt.
+
+    Honors a numeric Retry-After header when the server sent one,
+    otherwise uses exponential backoff with a little jitter.
+
+    Args:
+        attempt (int): The zero-based attempt number.
+        error (Exception): The exception that failed the attempt.
+
+    Returns:
+        float: The delay in seconds.
+    """
+    if isinstance(error, HttpError) and error.resp is not None:
+        retry_after = error.resp.get('retry-after')
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+    return 2 ** attempt * 0.5 + random.random() * 0.1
+
+
+def _run_sync(service, creds):
+    """
+    Run one full sync pass: list modified files and fan out the work.
+
+    Args:
+        service: The Google Drive API service object.
+        creds: The Google OAuth credentials.
+    """
+    query_modified_time = read_modified_time_from_file()
+
+    if not query_modified_time:
+        query_modified_time = get_current_time_formatted()
+        save_modified_time_to_file(query_modified_time)
+
+    # Load the tracking ledgers once so membership checks are O(1) in-memory
+    uploaded_set = load_uploaded_files(UPLOADED_FILE_PATH)
+    failed_set = load_uploaded_files(FAILED_FILE_PATH)
+    unsupported_set = load_uploaded_files(UNSUPPORTED_FILE_PATH)
+
+    lock = threading.Lock()
+    pending = []
+    found_files = False
+
+    # Fan the per-file work out over a bounded thread pool; items are
+    # submitted as the paginated listing streams in.
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            for item in list_modified_files(service, build_drive_query(query_modified_time)):
+                found_files = True
+                executor.submit(process_file, item, service, creds, uploaded_set, failed_set, unsupported_set, pending, lock)
+    finally:
+        # Process whatever is left over once all workers have finished,
+        # even if the listing failed mid-iteration - those files are
+        # already uploaded and would otherwise be re-uploaded on retry.
+        flush_process_batch(pending, uploaded_set, failed_set, lock)
+
+    if not found_files:
+        logging.info("No files found.")
+
+
+def main():
+    """
+    Main function to synchronize files from Google Drive to Instill Catalog.
+
+    Authenticates with Google Drive, then drives bounded retries around
+    _run_sync: rate limits and server errors back off and retry, other
+    client errors fail fast. Handles errors and logging.
+    """
+    creds = get_credentials()
+    # Build the Drive service once from the bundled discovery document and
+    # reuse it across retries; fetching or caching it per call is wasted work.
+    service = build("drive", "v3", credentials=creds, cache_discovery=False, static_discovery=True)
+
+    for attempt in range(MAX_RETRIES):
+        try:
+            _run_sync(service, creds)
+            return
+
+        except HttpError as error:
+            logging.warning(error)
+            status = error.resp.status if error.resp is not None else None
+            if status is not None and status < 500 and status != 429:
+                # Client errors other than rate limiting will not succeed on retry
+                return
+            time.sleep(_backoff_delay(attempt, error))
+
+        except Exception as error:
+            logging.warning(error)
+            time.sleep(_backoff_delay(attempt, error))
+
+    logging.warning(f"Sync failed after {MAX_RETRIES} attempts.")
 
 
 if __name__ == "__main__":